@@ -1,11 +1,18 @@
 # app_chat_survey.py
+# gevent must patch the stdlib before anything opens sockets
+from gevent import monkey
+monkey.patch_all()
+
 import os
-from flask import Flask, render_template, request, jsonify
+import base64
+import orjson
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 # Conversational + Survey imports
-from chat_agent import handle_user_query
+from chat_agent import handle_user_query, handle_user_query_stream
 from survey_agent import process_unscored_responses
 
 # NEW: Speech-to-text
@@ -13,9 +20,40 @@ from speech_to_text import transcribe_pcm
 
 load_dotenv()
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (jsonify + request.get_json)."""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        # Let Flask's default() format dates (RFC 822), as the stock provider does
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("sort_keys"):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__, static_folder="static", template_folder="templates")
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Endpoints whose responses must reach the client chunk-by-chunk.
+# Render's edge proxy (Nginx-style) honours X-Accel-Buffering and will
+# otherwise hold the whole body before forwarding it.
+STREAMING_ENDPOINTS = {'ask_stream', 'speech_chat'}
+
+
+@app.after_request
+def disable_proxy_buffering(response):
+    if request.endpoint in STREAMING_ENDPOINTS:
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 
 @app.route('/')
 def home():
@@ -45,22 +83,54 @@ def ask():
         return jsonify({'reply': "⚠️ Something went wrong on the server. Check logs."})
 
 
+# -----------------------------
+# TEXT CHAT (STREAMING, SSE)
+# -----------------------------
+def _sse(payload: dict) -> str:
+    # JSON keeps newlines in the reply from breaking SSE framing
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    user_input = (request.get_json(silent=True) or {}).get('message', '')
+
+    def generate():
+        if not user_input or not user_input.strip():
+            yield _sse({'delta': "⚠️ Please enter a valid message."})
+        else:
+            try:
+                for piece in handle_user_query_stream(user_input):
+                    yield _sse({'delta': piece})
+            except Exception as e:
+                print(f"❌ Error in /ask/stream route: {type(e).__name__}: {e}")
+                yield _sse({'delta': "⚠️ Something went wrong on the server. Check logs."})
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+
 # -----------------------------
 # SPEECH → CHAT (NEW)
 # -----------------------------
 @app.route('/speech-chat', methods=['POST'])
 def speech_chat():
     try:
-        data = request.get_json()
-        pcm_base64 = data.get("audio")
-        sample_rate = data.get("sampleRate", 16000)
-
-        if not pcm_base64:
+        audio_file = request.files.get("audio")
+        if audio_file is not None:
+            # multipart/form-data: raw PCM, no base64 overhead
+            pcm_bytes = audio_file.stream.read()
+            sample_rate = int(request.form.get("sampleRate", 16000))
+        else:
+            # Legacy JSON body with base64 PCM
+            data = request.get_json(silent=True) or {}
+            pcm_base64 = data.get("audio")
+            sample_rate = data.get("sampleRate", 16000)
+            pcm_bytes = memoryview(base64.b64decode(pcm_base64, validate=False)) if pcm_base64 else b""
+
+        if not pcm_bytes:
             return jsonify({"reply": "No audio received"})
 
-        import base64
-        pcm_bytes = base64.b64decode(pcm_base64)
-
         transcript = transcribe_pcm(pcm_bytes, sample_rate)
 
         if not transcript:
@@ -105,5 +175,7 @@ def api_survey_process():
 
 
 if __name__ == '__main__':
+    # Local development only; production runs under gunicorn (see Procfile)
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('FLASK_DEBUG', '') not in ('', '0', 'false', 'False')
+    app.run(host='0.0.0.0', port=port, debug=debug)
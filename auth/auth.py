@@ -52,6 +52,42 @@ def _load_users() -> Dict[str, str]:
     return data.get("users", {})
 
 
+# --------------------------------------------------------------------------
+# In-memory users cache (the Render secret file never changes at runtime;
+# the local file is re-read only when its mtime moves)
+# --------------------------------------------------------------------------
+
+_USERS_CACHE: Dict[str, str] = {}
+_HASH_BYTES: Dict[str, bytes] = {}  # bcrypt hashes pre-encoded for checkpw
+_USERS_MTIME = 0.0
+
+# bcrypt only looks at the first 72 bytes of a password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+
+def _users_mtime() -> float:
+    try:
+        return os.path.getmtime(USERS_PATH)
+    except OSError:
+        return 0.0
+
+
+def reload_users() -> Dict[str, str]:
+    global _USERS_CACHE, _HASH_BYTES, _USERS_MTIME
+    _USERS_MTIME = _users_mtime()
+    _USERS_CACHE = _load_users()
+    _HASH_BYTES = {
+        u: h.encode("utf-8") for u, h in _USERS_CACHE.items() if h.startswith("$2")
+    }
+    return _USERS_CACHE
+
+
+def _get_users() -> Dict[str, str]:
+    if not str(USERS_PATH).startswith("/etc/secrets") and _users_mtime() != _USERS_MTIME:
+        reload_users()
+    return _USERS_CACHE
+
+
 def _save_users(users: Dict[str, str]):
     # DO NOT write to Render secret file (it is read-only)
     if str(USERS_PATH).startswith("/etc/secrets"):
@@ -63,6 +99,8 @@ def _save_users(users: Dict[str, str]):
     with open(USERS_PATH, "w", encoding="utf-8") as f:
         json.dump({"users": users}, f, indent=2)
 
+    reload_users()
+
 
 def add_user(username: str, password: str) -> None:
     if str(USERS_PATH).startswith("/etc/secrets"):
@@ -73,8 +111,9 @@ def add_user(username: str, password: str) -> None:
     if not password:
         raise ValueError("password required")
 
-    users = _load_users()
-    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    users = dict(_get_users())
+    pw = password.encode("utf-8")[:BCRYPT_MAX_PASSWORD_BYTES]
+    hashed = bcrypt.hashpw(pw, bcrypt.gensalt())
     users[username] = hashed.decode("utf-8")
     _save_users(users)
 
@@ -83,17 +122,20 @@ def verify_user(username: str, password: str) -> bool:
     if not username or not password:
         return False
 
-    users = _load_users()
-    stored = users.get(username)
+    stored = _get_users().get(username)
     if not stored:
         return False
 
-    if stored.startswith("$2"):
-        return bcrypt.checkpw(password.encode("utf-8"), stored.encode("utf-8"))
+    stored_bytes = _HASH_BYTES.get(username)
+    if stored_bytes is not None:
+        pw = password.encode("utf-8")[:BCRYPT_MAX_PASSWORD_BYTES]
+        return bcrypt.checkpw(pw, stored_bytes)
 
     # Legacy plaintext support (local only)
     if password == stored:
-        hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        pw = password.encode("utf-8")[:BCRYPT_MAX_PASSWORD_BYTES]
+        hashed = bcrypt.hashpw(pw, bcrypt.gensalt()).decode("utf-8")
+        users = dict(_get_users())
         users[username] = hashed
         _save_users(users)
         return True
@@ -102,4 +144,7 @@ def verify_user(username: str, password: str) -> bool:
 
 
 def list_users():
-    return list(_load_users().keys())
+    return list(_get_users().keys())
+
+
+reload_users()
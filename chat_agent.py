@@ -9,9 +9,15 @@ Ask-me-anything agent for Olyph AI.
 import os
 import re
 import fitz
-import nltk
 import traceback
 import math
+import time
+import hashlib
+import functools
+import queue
+import threading
+from concurrent.futures import Future
+import joblib
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -26,9 +32,16 @@ else:
     load_dotenv()  # local development fallback
 
 # sklearn & text utils
-from nltk.corpus import stopwords
+import numpy as np
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+# Numba (optional) for the dense FAQ similarity scan
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
 # Google Sheets
 import json
@@ -36,17 +49,43 @@ import gspread
 from google.oauth2.service_account import Credentials
 
 # Azure OpenAI
+import httpx
 from openai import AzureOpenAI
 
-# NLTK resources
-nltk.download("punkt", quiet=True)
-nltk.download("stopwords", quiet=True)
+# NLTK English stopword list, vendored so startup needs no corpus download
+_STOPWORDS = frozenset({
+    "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you",
+    "you're", "you've", "you'll", "you'd", "your", "yours", "yourself",
+    "yourselves", "he", "him", "his", "himself", "she", "she's", "her", "hers",
+    "herself", "it", "it's", "its", "itself", "they", "them", "their",
+    "theirs", "themselves", "what", "which", "who", "whom", "this", "that",
+    "that'll", "these", "those", "am", "is", "are", "was", "were", "be",
+    "been", "being", "have", "has", "had", "having", "do", "does", "did",
+    "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as",
+    "until", "while", "of", "at", "by", "for", "with", "about", "against",
+    "between", "into", "through", "during", "before", "after", "above",
+    "below", "to", "from", "up", "down", "in", "out", "on", "off", "over",
+    "under", "again", "further", "then", "once", "here", "there", "when",
+    "where", "why", "how", "all", "any", "both", "each", "few", "more",
+    "most", "other", "some", "such", "no", "nor", "not", "only", "own",
+    "same", "so", "than", "too", "very", "s", "t", "can", "will", "just",
+    "don", "don't", "should", "should've", "now", "d", "ll", "m", "o", "re",
+    "ve", "y", "ain", "aren", "aren't", "couldn", "couldn't", "didn",
+    "didn't", "doesn", "doesn't", "hadn", "hadn't", "hasn", "hasn't", "haven",
+    "haven't", "isn", "isn't", "ma", "mightn", "mightn't", "mustn", "mustn't",
+    "needn", "needn't", "shan", "shan't", "shouldn", "shouldn't", "wasn",
+    "wasn't", "weren", "weren't", "won", "won't", "wouldn", "wouldn't",
+})
 
 # ---------- CONFIG ----------
 FAQ_FROM_SHEET_ID = os.getenv("CHAT_FAQ_SHEET_ID", "").strip()
 FAQ_FROM_SHEET_NAME = os.getenv("CHAT_FAQ_SHEET_NAME", "FAQ").strip()
 FAQ_PDF_PATH = os.getenv("CHAT_FAQ_PDF_PATH", "Olyphaunt FAQs.pdf")
 threshold = float(os.getenv("CHAT_FAQ_SIM_THRESHOLD", 0.8))
+CACHE_DIR = os.getenv("CHAT_CACHE_DIR", "cache")
+FAQ_SHEET_CACHE_TTL = float(os.getenv("CHAT_FAQ_SHEET_CACHE_TTL", 600))
+FAQ_BATCH_WINDOW_MS = float(os.getenv("CHAT_FAQ_BATCH_WINDOW_MS", 10))
+FAQ_BATCH_TIMEOUT = float(os.getenv("CHAT_FAQ_BATCH_TIMEOUT", 5))
 
 DEBUG = os.getenv("CHAT_DEBUG", "") not in ("", "0", "false", "False")
 
@@ -59,10 +98,22 @@ AZURE_API_VERSION = os.getenv("AZURE_API_VERSION", "2024-02-15-preview")
 if not (AZURE_OPENAI_KEY and AZURE_OPENAI_ENDPOINT):
     print("⚠️ Warning: Azure OpenAI config missing in environment.")
 
+# One pooled HTTP/2 connection set for all chat calls; limits/http2 live on
+# the transport since httpx ignores them on the Client when a transport is given
+_http = httpx.Client(
+    transport=httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=120.0),
+        retries=2,
+    ),
+    timeout=30.0,
+)
+
 client = AzureOpenAI(
     api_key=AZURE_OPENAI_KEY,
     api_version=AZURE_API_VERSION,
     azure_endpoint=AZURE_OPENAI_ENDPOINT,
+    http_client=_http,
 )
 
 # ---------- Google credentials helper ----------
@@ -94,13 +145,56 @@ def get_google_creds():
 
     return None
 
+def _dump_atomic(obj, path: Path, **kwargs):
+    """joblib.dump via a temp file + os.replace, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        joblib.dump(obj, tmp, **kwargs)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
 # ---------- Load FAQ from Google Sheet ----------
+def _faq_sheet_cache_path() -> Path:
+    return Path(CACHE_DIR) / "faq_sheet.joblib"
+
+def _load_cached_faq_sheet():
+    """Q/A pairs from a recent sheet fetch (same sheet, within TTL), else None."""
+    path = _faq_sheet_cache_path()
+    if FAQ_SHEET_CACHE_TTL <= 0 or not path.exists():
+        return None
+    try:
+        fetched_at, source, qa_pairs = joblib.load(path)
+    except Exception:
+        return None
+    if source != (FAQ_FROM_SHEET_ID, FAQ_FROM_SHEET_NAME):
+        return None
+    if time.time() - fetched_at > FAQ_SHEET_CACHE_TTL:
+        return None
+    return qa_pairs
+
+def _save_cached_faq_sheet(qa_pairs):
+    path = _faq_sheet_cache_path()
+    try:
+        _dump_atomic((time.time(), (FAQ_FROM_SHEET_ID, FAQ_FROM_SHEET_NAME), qa_pairs), path)
+    except Exception:
+        if DEBUG:
+            print("[FAQ] Could not write sheet cache:", path)
+
 def load_faq_from_sheet():
     if not FAQ_FROM_SHEET_ID:
         if DEBUG:
             print("[FAQ] CHAT_FAQ_SHEET_ID not set; skipping sheet load.")
         return []
 
+    cached = _load_cached_faq_sheet()
+    if cached:
+        if DEBUG:
+            print(f"[FAQ] Loaded {len(cached)} Q/A pairs from sheet cache")
+        return cached
+
     creds = get_google_creds()
     if creds is None:
         if DEBUG:
@@ -111,35 +205,39 @@ def load_faq_from_sheet():
         gc = gspread.authorize(creds)
         wb = gc.open_by_key(FAQ_FROM_SHEET_ID)
         ws = wb.worksheet(FAQ_FROM_SHEET_NAME)
-        rows = ws.get_all_records()
+        # One round-trip: header row + data rows together
+        values = ws.get_all_values()
 
-        if not rows:
+        if len(values) < 2:
             return []
 
-        headers = [h.strip() for h in ws.row_values(1)]
+        headers = [h.strip() for h in values[0]]
 
         def find_col(names):
-            for h in headers:
+            for i, h in enumerate(headers):
                 if h.lower() in names:
-                    return h
+                    return i
             return None
 
         qcol = find_col({"question", "q", "prompt", "query", "formquestion"})
         acol = find_col({"answer", "response", "modelanswer", "reply"})
 
-        if not qcol or not acol:
+        if qcol is None or acol is None:
             raise ValueError("Question/Answer columns not found in FAQ sheet")
 
         qa_pairs = []
-        for r in rows:
-            q = (r.get(qcol) or "").strip()
-            a = (r.get(acol) or "").strip()
+        for r in values[1:]:
+            q = (r[qcol] if qcol < len(r) else "").strip()
+            a = (r[acol] if acol < len(r) else "").strip()
             if q and a:
                 qa_pairs.append((q, a))
 
         if DEBUG:
             print(f"[FAQ] Loaded {len(qa_pairs)} Q/A pairs from sheet")
 
+        if qa_pairs:
+            _save_cached_faq_sheet(qa_pairs)
+
         return qa_pairs
 
     except Exception as e:
@@ -155,29 +253,28 @@ def extract_pdf_text(pdf_path: str):
         return qa_pairs
 
     try:
-        with fitz.open(pdf_path) as doc:
-            text = ""
-            for p in range(len(doc)):
-                text += doc[p].get_text("text")
+        question, answer_parts = None, []
 
-        lines = text.splitlines()
-        question, answer = None, ""
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
+        def flush():
+            if question and answer_parts:
+                qa_pairs.append((question, " ".join(answer_parts)))
 
-            if line.endswith("?"):
-                if question and answer:
-                    qa_pairs.append((question, answer.strip()))
-                question = line
-                answer = ""
-            elif question:
-                answer += " " + line
-
-        if question and answer:
-            qa_pairs.append((question, answer.strip()))
+        with fitz.open(pdf_path) as doc:
+            # Walk page by page so the whole document is never held as one string
+            for page in doc:
+                for line in page.get_text("text").splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    if line.endswith("?"):
+                        flush()
+                        question = line
+                        answer_parts = []
+                    elif question:
+                        answer_parts.append(line)
+
+        flush()
 
         return qa_pairs
 
@@ -195,40 +292,244 @@ if not qa_pairs:
         ("What is Olyphaunt Solutions?", "Olyphaunt Solutions is a healthcare technology company.")
     ]
 
+# ---------- TF-IDF cache ----------
+TFIDF_PARAMS = dict(
+    max_features=5000,
+    min_df=1,
+    sublinear_tf=True,
+    ngram_range=(1, 2),
+    dtype=np.float32,
+)
+
+def new_vectorizer() -> TfidfVectorizer:
+    return TfidfVectorizer(stop_words=sorted(_STOPWORDS), **TFIDF_PARAMS)
+
+def _tfidf_cache_path(qa_pairs) -> Path:
+    # Vectorizer settings and the sklearn version are part of the key so a
+    # config change or upgrade refits instead of unpickling a stale model
+    payload = (
+        json.dumps(qa_pairs)
+        + repr(sorted(TFIDF_PARAMS.items()))
+        + repr(sorted(_STOPWORDS))
+        + sklearn.__version__
+    )
+    key = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return Path(CACHE_DIR) / f"tfidf_{key}.joblib"
+
+def load_or_fit_tfidf(qa_pairs, questions):
+    """
+    Returns (vectorizer, question_vectors), loading them from disk when the
+    FAQ content is unchanged since the last fit.
+    """
+    cache_path = _tfidf_cache_path(qa_pairs)
+    if cache_path.exists():
+        try:
+            vectorizer, question_vectors = joblib.load(cache_path)
+            if DEBUG:
+                print(f"[FAQ] Loaded TF-IDF cache {cache_path}")
+            return vectorizer, question_vectors
+        except Exception:
+            if DEBUG:
+                traceback.print_exc()
+
+    vectorizer = new_vectorizer()
+    question_vectors = vectorizer.fit_transform(questions)
+
+    try:
+        _dump_atomic((vectorizer, question_vectors), cache_path, compress=3)
+    except Exception:
+        if DEBUG:
+            print("[FAQ] Could not write TF-IDF cache:", cache_path)
+            traceback.print_exc()
+
+    return vectorizer, question_vectors
+
+# ---------- Dense similarity scan ----------
+# Small FAQ matrices are cheaper to scan densely than through scipy.sparse
+DENSE_MAX_CELLS = 2_000_000
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cos_scan(Q, X):
+        # One launch for the whole batch: prange over (query, row) pairs
+        m, n = X.shape[0], Q.shape[0]
+        out = np.empty((m, n), dtype=np.float32)
+        for k in prange(m * n):
+            i, r = k // n, k % n
+            s = np.float32(0.0)
+            for j in range(Q.shape[1]):
+                s += Q[r, j] * X[i, j]
+            out[i, r] = s
+        return out
+else:
+    def _cos_scan(Q, X):
+        return X @ Q.T
+
+# ---------- Query micro-batching ----------
+class BatchQueue:
+    """
+    Scores queued queries together with a single call to
+    score_batch(queries) -> results (same order).
+    Whatever is already queued is scored straight away; the worker only waits
+    (up to window_ms) when other submits are known to be in flight.
+    The worker thread starts on first submit (after any gunicorn fork).
+    """
+
+    def __init__(self, score_batch, window_ms=10.0, max_batch=64):
+        self._score_batch = score_batch
+        self._window = window_ms / 1000.0
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = 0  # submits started but not yet taken by the worker
+
+    def submit(self, query) -> Future:
+        with self._lock:
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="faq-batcher", daemon=True
+                )
+                self._thread.start()
+        future = Future()
+        self._queue.put((query, future))
+        return future
+
+    def _take(self, item, batch):
+        batch.append(item)
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self):
+        while True:
+            batch = []
+            self._take(self._queue.get(), batch)
+
+            # Drain what is already queued without waiting
+            while len(batch) < self._max_batch:
+                try:
+                    self._take(self._queue.get_nowait(), batch)
+                except queue.Empty:
+                    break
+
+            # Wait for stragglers only if a submit is mid-flight
+            deadline = time.monotonic() + self._window
+            while self._pending > 0 and len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    self._take(self._queue.get(timeout=remaining), batch)
+                except queue.Empty:
+                    break
+
+            try:
+                results = self._score_batch([q for q, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
 # ---------- Chatbot ----------
+def normalize_query(text: str) -> str:
+    """Lowercase and collapse whitespace."""
+    return " ".join(text.lower().split())
+
 class OlyphauntChatbot:
     def __init__(self, qa_pairs):
         self.qa_pairs = qa_pairs
         self.questions = [q.lower() for q, _ in qa_pairs]
         self.answers = [a for _, a in qa_pairs]
-        self.vectorizer = TfidfVectorizer(stop_words=stopwords.words("english"))
+        # First occurrence wins, matching argmax on the TF-IDF path
+        self._exact = {}
+        for q, a in qa_pairs:
+            self._exact.setdefault(normalize_query(q), a)
+        self._faq_lookup = functools.lru_cache(maxsize=1024)(self._tfidf_lookup)
+        self._batcher = BatchQueue(self._tfidf_lookup_batch, window_ms=FAQ_BATCH_WINDOW_MS)
         try:
-            self.question_vectors = self.vectorizer.fit_transform(self.questions)
+            self.vectorizer, self.question_vectors = load_or_fit_tfidf(qa_pairs, self.questions)
         except Exception:
+            self.vectorizer = new_vectorizer()
             self.question_vectors = None
 
-    def respond(self, user_query: str) -> str:
-        if not user_query:
-            return "⚠️ Please enter a valid question."
+        # Rows are unit length, so cosine similarity is a plain sparse dot product
+        self.QT = None
+        if self.question_vectors is not None:
+            if self.vectorizer.norm != "l2":
+                self.question_vectors = normalize(self.question_vectors, copy=False)
+            self.QT = self.question_vectors.T.tocsr()
+
+        self.Q_dense = None
+        if self.question_vectors is not None:
+            rows, cols = self.question_vectors.shape
+            if rows * cols < DENSE_MAX_CELLS:
+                self.Q_dense = np.ascontiguousarray(
+                    self.question_vectors.toarray(), dtype=np.float32
+                )
+                # Trigger JIT compilation now rather than on the first request
+                _cos_scan(self.Q_dense, np.zeros((1, cols), dtype=np.float32))
+
+    def _tfidf_lookup_batch(self, norm_queries):
+        """Best FAQ answer above threshold (or None) for each normalized query."""
+        if self.QT is None:
+            return [None] * len(norm_queries)
+        qvecs = self.vectorizer.transform(norm_queries)
+        if self.vectorizer.norm != "l2":
+            qvecs = normalize(qvecs, copy=False)
+        if self.Q_dense is not None:
+            qdense = np.ascontiguousarray(qvecs.toarray(), dtype=np.float32)
+            sims = _cos_scan(self.Q_dense, qdense)
+        else:
+            sims = (qvecs @ self.QT).toarray()
+
+        best = sims.argmax(axis=1)
+        scores = sims[np.arange(len(norm_queries)), best]
+        return [
+            self.answers[int(idx)] if score >= threshold else None
+            for idx, score in zip(best, scores)
+        ]
+
+    def _tfidf_lookup(self, norm_query: str):
+        """Best FAQ answer above threshold for an already-normalized query, else None."""
+        if self.QT is None:
+            return None
+        return self._batcher.submit(norm_query).result(timeout=FAQ_BATCH_TIMEOUT)
+
+    def _match_faq(self, user_query: str):
+        norm_query = normalize_query(user_query)
+        exact = self._exact.get(norm_query)
+        if exact is not None:
+            return exact
 
         try:
-            if self.question_vectors is not None:
-                qvec = self.vectorizer.transform([user_query.lower()])
-                sims = cosine_similarity(qvec, self.question_vectors)
-                idx = sims.argmax()
-                if sims[0, idx] >= threshold:
-                    return self.answers[idx]
+            return self._faq_lookup(norm_query)
         except Exception:
             traceback.print_exc()
+            return None
+
+    def _chat_messages(self, user_query: str):
+        return [
+            {"role": "system", "content": "You are an assistant for Olyphaunt Solutions."},
+            {"role": "user", "content": user_query},
+        ]
+
+    def respond(self, user_query: str) -> str:
+        if not user_query:
+            return "⚠️ Please enter a valid question."
+
+        answer = self._match_faq(user_query)
+        if answer is not None:
+            return answer
 
         # Azure fallback
         try:
             resp = client.chat.completions.create(
                 model=AZURE_DEPLOYMENT_NAME,
-                messages=[
-                    {"role": "system", "content": "You are an assistant for Olyphaunt Solutions."},
-                    {"role": "user", "content": user_query},
-                ],
+                messages=self._chat_messages(user_query),
                 temperature=0.2,
                 max_tokens=256,
             )
@@ -237,8 +538,45 @@ class OlyphauntChatbot:
             traceback.print_exc()
             return "⚠️ Azure OpenAI is currently unavailable."
 
+    def respond_stream(self, user_query: str):
+        """
+        Same as respond(), but yields the reply in pieces as Azure generates it.
+        FAQ hits are yielded as a single piece.
+        """
+        if not user_query:
+            yield "⚠️ Please enter a valid question."
+            return
+
+        answer = self._match_faq(user_query)
+        if answer is not None:
+            yield answer
+            return
+
+        # Azure fallback (streamed)
+        try:
+            stream = client.chat.completions.create(
+                model=AZURE_DEPLOYMENT_NAME,
+                messages=self._chat_messages(user_query),
+                temperature=0.2,
+                max_tokens=256,
+                stream=True,
+            )
+            for chunk in stream:
+                # Azure sends content-filter chunks with no choices
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception:
+            traceback.print_exc()
+            yield "⚠️ Azure OpenAI is currently unavailable."
+
 # ---------- Public handler ----------
 chatbot = OlyphauntChatbot(qa_pairs)
 
 def handle_user_query(user_message: str) -> str:
     return chatbot.respond(user_message)
+
+def handle_user_query_stream(user_message: str):
+    return chatbot.respond_stream(user_message)
@@ -1,8 +1,14 @@
 # speech_to_text.py
 import os
+import threading
 import azure.cognitiveservices.speech as speechsdk
 from dotenv import load_dotenv
 
+try:
+    from gevent import get_hub, monkey
+except ImportError:
+    get_hub = None
+
 # ----------------------------------
 # Load .env from Render Secret Files
 # ----------------------------------
@@ -13,17 +19,83 @@ if os.path.exists(ENV_PATH):
 else:
     load_dotenv()
 
+# 100 ms of 16-bit mono audio at 16 kHz
+PUSH_CHUNK_BYTES = 3200
+
+# Extra time allowed past the audio length for the session to finish
+RECOGNITION_TIMEOUT_PAD_S = 15
+
+# ----------------------------------
+# Shared config (built once per process)
+# ----------------------------------
+AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
+AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION")
+
+_SPEECH_CONFIG = None
+if AZURE_SPEECH_KEY and AZURE_SPEECH_REGION:
+    _SPEECH_CONFIG = speechsdk.SpeechConfig(
+        subscription=AZURE_SPEECH_KEY,
+        region=AZURE_SPEECH_REGION
+    )
+    _SPEECH_CONFIG.speech_recognition_language = "en-IN"
+    # Uploads are prerecorded, so let the SDK send audio faster than its
+    # default 2x real-time throttle ("Befor" is the SDK's own spelling)
+    _SPEECH_CONFIG.set_property_by_name("SPEECH-AudioThrottleAsPercentageOfRealTime", "500")
+    _SPEECH_CONFIG.set_property_by_name("SPEECH-TransmitLengthBeforThrottleMs", "5000")
+    _SPEECH_CONFIG.set_property_by_name("SPEECH-MaxBufferSizeSeconds", "60")
+else:
+    # Keep the app importable without speech creds; transcribe_pcm raises instead
+    print("⚠️ Warning: Azure Speech credentials missing in environment.")
+
+_STREAM_FORMATS = {}
+
+
+def _get_stream_format(sample_rate: int):
+    stream_format = _STREAM_FORMATS.get(sample_rate)
+    if stream_format is None:
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate,
+            bits_per_sample=16,
+            channels=1
+        )
+        _STREAM_FORMATS[sample_rate] = stream_format
+    return stream_format
+
+
+# Browsers are asked for 16 kHz, so that format is built up front
+DEFAULT_SAMPLE_RATE = 16000
+_get_stream_format(DEFAULT_SAMPLE_RATE)
+
+
+def _gevent_patched() -> bool:
+    return get_hub is not None and monkey.is_module_patched("threading")
+
 
-def transcribe_pcm(pcm_bytes: bytes, sample_rate=16000) -> str:
+def _run_blocking(fn, *args):
+    """
+    Run a call that blocks in native SDK code. Under gevent that would stall
+    the whole worker, so it is pushed to the hub's threadpool instead.
+    """
+    if _gevent_patched():
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def _native_event():
+    # SDK callbacks fire on native threads, which must not touch a
+    # gevent-patched Event; use the original threading.Event there
+    if _gevent_patched():
+        return monkey.get_original("threading", "Event")()
+    return threading.Event()
+
+
+def transcribe_pcm(pcm_bytes: bytes, sample_rate=DEFAULT_SAMPLE_RATE) -> str:
     """
     Transcribes raw PCM audio bytes using Azure Speech-to-Text.
     SAFE for repeated calls in Flask / Render.
     """
 
-    speech_key = os.getenv("AZURE_SPEECH_KEY")
-    speech_region = os.getenv("AZURE_SPEECH_REGION")
-
-    if not speech_key or not speech_region:
+    if _SPEECH_CONFIG is None:
         raise RuntimeError(
             "Azure Speech credentials not found. "
             "Check Render secret env or local .env."
@@ -32,44 +104,58 @@ def transcribe_pcm(pcm_bytes: bytes, sample_rate=16000) -> str:
     recognizer = None
     push_stream = None
     audio_config = None
+    stopped = False
 
     try:
-        speech_config = speechsdk.SpeechConfig(
-            subscription=speech_key,
-            region=speech_region
-        )
-        speech_config.speech_recognition_language = "en-IN"
-
-        stream_format = speechsdk.audio.AudioStreamFormat(
-            samples_per_second=sample_rate,
-            bits_per_sample=16,
-            channels=1
-        )
+        stream_format = _get_stream_format(int(sample_rate))
 
         push_stream = speechsdk.audio.PushAudioInputStream(stream_format)
         audio_config = speechsdk.audio.AudioConfig(stream=push_stream)
 
         recognizer = speechsdk.SpeechRecognizer(
-            speech_config=speech_config,
+            speech_config=_SPEECH_CONFIG,
             audio_config=audio_config
         )
 
-        # Push audio
-        push_stream.write(pcm_bytes)
-        push_stream.close()
+        # Continuous recognition keeps every segment of multi-sentence audio
+        # (recognize_once stops after the first utterance)
+        segments = []
+        done = _native_event()
 
-        result = recognizer.recognize_once()
+        def on_recognized(evt):
+            if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech:
+                text = evt.result.text.strip()
+                if text:
+                    segments.append(text)
+
+        recognizer.recognized.connect(on_recognized)
+        recognizer.session_stopped.connect(lambda evt: done.set())
+        recognizer.canceled.connect(lambda evt: done.set())
+
+        # Start recognition first so it overlaps with pushing the audio
+        _run_blocking(recognizer.start_continuous_recognition_async().get)
+
+        # Push audio in small chunks so the SDK can start decoding early
+        audio = memoryview(pcm_bytes)
+        for i in range(0, len(audio), PUSH_CHUNK_BYTES):
+            push_stream.write(audio[i:i + PUSH_CHUNK_BYTES].tobytes())
+        push_stream.close()
 
-        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-            return result.text.strip()
+        # Closing the stream ends the session once the tail is decoded
+        audio_seconds = len(audio) / (2 * int(sample_rate))
+        _run_blocking(done.wait, audio_seconds + RECOGNITION_TIMEOUT_PAD_S)
+        _run_blocking(recognizer.stop_continuous_recognition_async().get)
+        stopped = True
 
-        return ""
+        return " ".join(segments)
 
     finally:
         # 🔥 CRITICAL CLEANUP (fixes one-time-only bug)
         try:
             if recognizer:
-                recognizer.stop_continuous_recognition()
+                # Only the error path still needs a stop; keep it off the hub
+                if not stopped:
+                    _run_blocking(recognizer.stop_continuous_recognition)
                 del recognizer
         except Exception:
             pass
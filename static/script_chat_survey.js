@@ -46,6 +46,47 @@ document.addEventListener("DOMContentLoaded", () => {
     chatBody.scrollTop = chatBody.scrollHeight;
   }
 
+  // Streams the reply from /ask/stream (SSE) into a single bot bubble
+  async function askStreaming(msg) {
+    const res = await fetch("/ask/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ message: msg })
+    });
+    if (!res.ok || !res.body) throw new Error("stream failed");
+
+    const div = document.createElement("div");
+    div.className = "bot-message";
+    chatBody.appendChild(div);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let reply = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        if (frame.startsWith("event: done")) continue;
+        const line = frame.split("\n").find((l) => l.startsWith("data: "));
+        if (!line) continue;
+        const { delta } = JSON.parse(line.slice(6));
+        if (!delta) continue;
+        reply += delta;
+        div.innerHTML = reply.replace(/\n/g, "<br>");
+        chatBody.scrollTop = chatBody.scrollHeight;
+      }
+    }
+
+    if (!reply) div.innerHTML = "⚠️ No reply";
+  }
+
   function clearInputHard() {
     if (userInput) {
       userInput.value = "";
@@ -107,13 +148,7 @@ document.addEventListener("DOMContentLoaded", () => {
     addMessage(msg, "user");
 
     try {
-      const res = await fetch("/ask", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: msg })
-      });
-      const data = await res.json();
-      addMessage(data.reply || "⚠️ No reply");
+      await askStreaming(msg);
     } catch {
       addMessage("⚠️ Server error");
     }
@@ -199,13 +234,7 @@ document.addEventListener("DOMContentLoaded", () => {
     addMessage(finalText, "user");
 
     try {
-      const res = await fetch("/ask", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: finalText })
-      });
-      const data = await res.json();
-      addMessage(data.reply || "⚠️ No reply");
+      await askStreaming(finalText);
     } catch {
       addMessage("⚠️ Server error");
     }
@@ -3,13 +3,17 @@
 
 import os
 import json
-import math
+import hashlib
+import sqlite3
+import threading
 import gspread
+import numpy as np
 from google.oauth2.service_account import Credentials
 from openai import AzureOpenAI
 from dotenv import load_dotenv
 import traceback
-from collections import Counter
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # -------------------------------------------------
 # Load .env explicitly (Render Secret Files support)
@@ -77,11 +81,22 @@ QUESTIONBANK_SHEET_NAME = os.getenv(
     "QuestionBank"
 )
 
+# Both the question bank and the responses live in this workbook; open it once
+_WB = None
+
+def _wb():
+    global _WB
+    if _WB is None:
+        _WB = gc.open_by_key(SPREADSHEET_ID)
+    return _WB
+
 # -----------------------
 # DYNAMIC QUESTION BANK LOADING
 # -----------------------
 QUESTION_COLUMNS = {}
 MODEL_ANSWERS = {}
+# Model answers never change while the process runs, so embed them once
+MODEL_ANSWER_VECS = {}   # qid -> unit-length float32 np.ndarray
 
 def load_question_bank():
     """
@@ -91,12 +106,13 @@ def load_question_bank():
       - FormQuestion (exact header in responses sheet)
       - ModelAnswer
     """
-    global QUESTION_COLUMNS, MODEL_ANSWERS
+    global QUESTION_COLUMNS, MODEL_ANSWERS, MODEL_ANSWER_VECS
     QUESTION_COLUMNS = {}
     MODEL_ANSWERS = {}
+    MODEL_ANSWER_VECS = {}
 
     try:
-        wb = gc.open_by_key(SPREADSHEET_ID)
+        wb = _wb()
         if DEBUG:
             print("[SURVEY][DEBUG] Worksheets:", [ws.title for ws in wb.worksheets()])
         qb_ws = wb.worksheet(QUESTIONBANK_SHEET_NAME)
@@ -105,37 +121,41 @@ def load_question_bank():
             f"Unable to open question bank worksheet '{QUESTIONBANK_SHEET_NAME}': {e}"
         )
 
-    rows = qb_ws.get_all_records()
-    if not rows:
+    # Header + rows in one call; the header is normalized once for find_key
+    values = qb_ws.get_all_values()
+    if len(values) < 2:
         raise ValueError(f"Question bank '{QUESTIONBANK_SHEET_NAME}' is empty.")
 
+    # normalized header -> first column index with that name
+    header = {}
+    for i, h in enumerate(values[0]):
+        header.setdefault(h.strip().lower(), i)
+
     def find_key(possible_names):
-        for header in qb_ws.row_values(1):
-            if header.strip().lower() in possible_names:
-                return header
-        return None
+        # Leftmost matching column, same as scanning the sheet in order
+        return min((header[n] for n in possible_names if n in header), default=None)
 
     qid_col = find_key({"qid", "id", "key"})
     formq_col = find_key({"formquestion", "question", "prompt", "form question"})
     model_col = find_key({"modelanswer", "answer", "model answer", "model_answer"})
 
-    if not formq_col or not model_col:
+    if formq_col is None or model_col is None:
         raise ValueError(
             "Question bank must contain FormQuestion and ModelAnswer columns."
         )
 
+    def cell(row, col):
+        return row[col].strip() if col is not None and col < len(row) else ""
+
     auto_counter = 1
-    for row in rows:
-        formq = (row.get(formq_col) or "").strip()
-        model = (row.get(model_col) or "").strip()
+    for row in values[1:]:
+        formq = cell(row, formq_col)
+        model = cell(row, model_col)
 
         if not formq:
             continue
 
-        if qid_col and row.get(qid_col):
-            qid = str(row.get(qid_col)).strip()
-        else:
-            qid = f"Q{auto_counter}"
+        qid = cell(row, qid_col) or f"Q{auto_counter}"
 
         QUESTION_COLUMNS[qid] = formq
         MODEL_ANSWERS[qid] = model
@@ -147,8 +167,21 @@ def load_question_bank():
     if DEBUG:
         print("[SURVEY][DEBUG] Loaded questions:", QUESTION_COLUMNS)
 
-# Load question bank at import
-load_question_bank()
+    embed_model_answers()
+
+# Loaded on first use rather than at import (saves two Sheets calls for
+# importers that never score anything)
+_question_bank_loaded = False
+_question_bank_lock = threading.Lock()
+
+def _ensure_question_bank_loaded():
+    global _question_bank_loaded
+    if _question_bank_loaded:
+        return
+    with _question_bank_lock:
+        if not _question_bank_loaded:
+            load_question_bank()
+            _question_bank_loaded = True
 
 # -----------------------
 # AZURE OPENAI SETUP
@@ -183,59 +216,235 @@ def simple_bow_embedding(a_text: str, b_text: str):
     a_counts = Counter(a_tokens)
     b_counts = Counter(b_tokens)
 
-    a_vec = [float(a_counts.get(w, 0)) for w in vocab]
-    b_vec = [float(b_counts.get(w, 0)) for w in vocab]
+    a_vec = np.fromiter((a_counts.get(w, 0) for w in vocab), dtype=np.float32, count=len(vocab))
+    b_vec = np.fromiter((b_counts.get(w, 0) for w in vocab), dtype=np.float32, count=len(vocab))
 
     def normalize(v):
-        norm = math.sqrt(sum(x * x for x in v))
-        return v if norm == 0 else [x / norm for x in v]
+        norm = np.linalg.norm(v)
+        if norm > 0:
+            v /= norm
+        return v
 
     return normalize(a_vec), normalize(b_vec)
 
+# Azure accepts up to 2048 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 2048
+
+# Rows scored in parallel, and a cap on in-flight embeddings requests
+# (size the latter to the deployment's rate limit)
+SCORING_WORKERS = int(os.getenv("SURVEY_SCORING_WORKERS", 8))
+MAX_CONCURRENT_EMBEDDINGS = int(os.getenv("SURVEY_MAX_CONCURRENT_EMBEDDINGS", 4))
+_embeddings_semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_EMBEDDINGS)
+
+# -----------------------
+# EMBEDDING CACHE (memory LRU in front of sqlite, keyed by text hash)
+# -----------------------
+EMBED_CACHE_PATH = os.getenv(
+    "SURVEY_EMBED_CACHE_PATH",
+    os.path.join("cache", "embeddings.sqlite3")
+)
+EMBED_MEM_CACHE_SIZE = 4096
+
+_embed_mem_cache = OrderedDict()
+_embed_db = None
+_embed_cache_lock = threading.Lock()
+
+def _embedding_key(text: str) -> str:
+    # Deployment and vector format ("l2" = stored unit-length) are part of the
+    # key so a model or format change never reuses old vectors
+    norm = text.strip().lower()
+    payload = f"l2\n{AZURE_EMBEDDINGS_DEPLOYMENT_NAME}\n{norm}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _embed_cache_db():
+    """Lazily opened sqlite connection, or None if persistence is unavailable."""
+    global _embed_db
+    if _embed_db is None:
+        _embed_db = False
+        if EMBED_CACHE_PATH:
+            try:
+                os.makedirs(os.path.dirname(EMBED_CACHE_PATH) or ".", exist_ok=True)
+                db = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vec BLOB)"
+                )
+                _embed_db = db
+            except Exception:
+                if DEBUG:
+                    traceback.print_exc()
+    return _embed_db or None
+
+def _embed_mem_put(key, vec):
+    _embed_mem_cache[key] = vec
+    _embed_mem_cache.move_to_end(key)
+    while len(_embed_mem_cache) > EMBED_MEM_CACHE_SIZE:
+        _embed_mem_cache.popitem(last=False)
+
+def _embed_cache_get(keys):
+    found = {}
+    with _embed_cache_lock:
+        for key in keys:
+            vec = _embed_mem_cache.get(key)
+            if vec is not None:
+                _embed_mem_cache.move_to_end(key)
+                found[key] = vec
+
+        rest = [k for k in keys if k not in found]
+        db = _embed_cache_db()
+        if rest and db is not None:
+            # stay well under sqlite's bound-parameter limit
+            for start in range(0, len(rest), 500):
+                part = rest[start:start + 500]
+                rows = db.execute(
+                    "SELECT hash, vec FROM embeddings WHERE hash IN (%s)"
+                    % ",".join("?" * len(part)),
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vec
+                    _embed_mem_put(key, vec)
+    return found
+
+def _embed_cache_put(items):
+    if not items:
+        return
+    with _embed_cache_lock:
+        for key, vec in items:
+            _embed_mem_put(key, vec)
+        db = _embed_cache_db()
+        if db is not None:
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)",
+                    [(key, vec.tobytes()) for key, vec in items]
+                )
+                db.commit()
+            except Exception:
+                if DEBUG:
+                    traceback.print_exc()
+
+def get_embeddings_batch(texts):
+    """
+    Embeds all non-empty texts, serving repeats from the embedding cache and
+    sending the misses to Azure in as few requests as possible.
+    Returns one entry per input text: an L2-normalized float32 vector, or
+    None if the text was empty or its request failed.
+    """
+    cleaned = [(t or "").strip() for t in texts]
+    vectors = [None] * len(cleaned)
+    keys = {i: _embedding_key(t) for i, t in enumerate(cleaned) if t}
+
+    cached = _embed_cache_get(list(dict.fromkeys(keys.values())))
+
+    # First position of each distinct uncached text
+    misses = {}
+    for i, key in keys.items():
+        if key in cached:
+            vectors[i] = cached[key]
+        else:
+            misses.setdefault(key, i)
+
+    miss_keys = list(misses)
+    fresh = {}
+    for start in range(0, len(miss_keys), EMBEDDING_BATCH_SIZE):
+        chunk = miss_keys[start:start + EMBEDDING_BATCH_SIZE]
+        try:
+            with _embeddings_semaphore:
+                resp = azure_client.embeddings.create(
+                    model=AZURE_EMBEDDINGS_DEPLOYMENT_NAME,
+                    input=[cleaned[misses[k]] for k in chunk]
+                )
+            for item in resp.data:
+                vec = np.asarray(item.embedding, dtype=np.float32)
+                norm = np.linalg.norm(vec)
+                if norm > 0:
+                    vec /= norm
+                fresh[chunk[item.index]] = vec
+        except Exception:
+            if DEBUG:
+                traceback.print_exc()
+
+    _embed_cache_put(list(fresh.items()))
+    for i, key in keys.items():
+        if vectors[i] is None and key in fresh:
+            vectors[i] = fresh[key]
+
+    return vectors
+
 def get_embedding_safe(text: str):
-    text = (text or "").strip()
-    if not text:
-        return None
-    try:
-        resp = azure_client.embeddings.create(
-            model=AZURE_EMBEDDINGS_DEPLOYMENT_NAME,
-            input=text
-        )
-        return [float(x) for x in resp.data[0].embedding]
-    except Exception:
-        if DEBUG:
-            traceback.print_exc()
-        return None
+    return get_embeddings_batch([text])[0]
 
 def cosine_similarity(vec1, vec2):
-    if not vec1 or not vec2 or len(vec1) != len(vec2):
+    """Cosine of two unit-length vectors (BOW vectors are pre-normalized)."""
+    if vec1 is None or vec2 is None or len(vec1) == 0 or len(vec1) != len(vec2):
         return 0.0
-    dot = sum(a * b for a, b in zip(vec1, vec2))
-    n1 = math.sqrt(sum(a * a for a in vec1))
-    n2 = math.sqrt(sum(b * b for b in vec2))
-    return 0.0 if n1 == 0 or n2 == 0 else dot / (n1 * n2)
-
-def score_single_pair(model_answer, user_answer):
-    model_vec = get_embedding_safe(model_answer)
-    user_vec = get_embedding_safe(user_answer)
-
-    if model_vec and user_vec:
-        sim = cosine_similarity(model_vec, user_vec)
-    else:
-        model_vec, user_vec = simple_bow_embedding(model_answer, user_answer)
-        sim = cosine_similarity(model_vec, user_vec)
+    sim = float(np.dot(vec1, vec2))
+    return min(1.0, max(-1.0, sim))
 
+def embed_model_answers(qids=None):
+    """
+    Embeds model answers (all, or just `qids`) in one request and caches the
+    vectors. Failed embeddings are simply left out.
+    """
+    qids = list(MODEL_ANSWERS) if qids is None else list(qids)
+    vectors = get_embeddings_batch([MODEL_ANSWERS[qid] for qid in qids])
+    for qid, vec in zip(qids, vectors):
+        if vec is not None:
+            MODEL_ANSWER_VECS[qid] = vec
+
+def score_single_pair(qid, user_answer):
+    """Bag-of-words score for a pair that is missing an embedding."""
+    model_vec, user_vec = simple_bow_embedding(MODEL_ANSWERS[qid], user_answer)
+    sim = cosine_similarity(model_vec, user_vec)
     return round(max(0.0, sim), 1)
 
+# Non-answers score 0 without being embedded
+TRIVIAL_ANSWERS = {"", "na", "n/a", "-", "none"}
+
 def score_answers_with_azure(user_answers: dict):
-    scores = {}
+    _ensure_question_bank_loaded()
+    scores = {qid: 0.0 for qid in MODEL_ANSWERS}
     total = 0.0
 
+    answered = []
     for qid, model_answer in MODEL_ANSWERS.items():
         user_answer = (user_answers.get(qid) or "").strip()
-        s = score_single_pair(model_answer, user_answer) if user_answer else 0.0
-        scores[qid] = s
-        total += s
+        norm = user_answer.lower()
+        # Exact match first: a model answer may itself be "None" or "N/A"
+        if model_answer and norm == model_answer.strip().lower():
+            scores[qid] = 1.0
+            continue
+        if norm in TRIVIAL_ANSWERS:
+            continue
+        answered.append((qid, user_answer))
+
+    # Retry model answers whose embedding failed at load time
+    missing = [qid for qid, _ in answered if qid not in MODEL_ANSWER_VECS]
+    if missing:
+        embed_model_answers(missing)
+
+    # One embeddings request for all of this row's answers
+    vectors = get_embeddings_batch([user_answer for _, user_answer in answered])
+
+    # Pairs with both embeddings: all cosines in one row-wise dot product
+    # (vectors are unit length); the rest fall back to bag-of-words
+    embedded = []
+    for (qid, user_answer), user_vec in zip(answered, vectors):
+        if user_vec is not None and qid in MODEL_ANSWER_VECS:
+            embedded.append((qid, user_vec))
+        else:
+            scores[qid] = score_single_pair(qid, user_answer)
+
+    if embedded:
+        U = np.stack([vec for _, vec in embedded])
+        M = np.stack([MODEL_ANSWER_VECS[qid] for qid, _ in embedded])
+        sims = np.einsum("ij,ij->i", U, M).clip(0.0, 1.0)
+        for (qid, _), sim in zip(embedded, sims):
+            scores[qid] = round(float(sim), 1)
+
+    for qid in MODEL_ANSWERS:
+        total += scores[qid]
 
     scores["total"] = round(total, 1)
     return scores
@@ -244,8 +453,11 @@ def score_answers_with_azure(user_answers: dict):
 # PROCESS RESPONSES SHEET
 # -----------------------
 def process_unscored_responses():
-    ws = gc.open_by_key(SPREADSHEET_ID).worksheet(RESPONSES_SHEET_NAME)
-    header = ws.row_values(1)
+    _ensure_question_bank_loaded()
+    ws = _wb().worksheet(RESPONSES_SHEET_NAME)
+    # Header + all rows in one call; cells are read by column position
+    values = ws.get_all_values()
+    header = values[0] if values else []
     col_index = {h: i + 1 for i, h in enumerate(header)}
 
     required_scores = [f"Score {qid}" for qid in QUESTION_COLUMNS]
@@ -255,27 +467,46 @@ def process_unscored_responses():
     if missing:
         raise ValueError(f"Missing columns in responses sheet: {missing}")
 
-    rows = ws.get_all_records()
     updated = 0
-
-    for i, row in enumerate(rows, start=2):
-        first_qid = next(iter(QUESTION_COLUMNS))
-        if str(row.get(f"Score {first_qid}", "")).strip():
+    cell_updates = []
+
+    def queue_cell(row_num, col_name, value):
+        cell = gspread.utils.rowcol_to_a1(row_num, col_index[col_name])
+        cell_updates.append({"range": cell, "values": [[value]]})
+
+    first_qid = next(iter(QUESTION_COLUMNS))
+    scored_pos = col_index[f"Score {first_qid}"] - 1
+    answer_pos = {
+        qid: col_index[header_name] - 1
+        for qid, header_name in QUESTION_COLUMNS.items()
+    }
+
+    pending = []  # (sheet row number, answers)
+    for i, row in enumerate(values[1:], start=2):
+        if scored_pos < len(row) and row[scored_pos].strip():
             continue
 
         answers = {
-            qid: row.get(header_name, "")
-            for qid, header_name in QUESTION_COLUMNS.items()
+            qid: row[pos] if pos < len(row) else ""
+            for qid, pos in answer_pos.items()
         }
+        pending.append((i, answers))
 
-        scores = score_answers_with_azure(answers)
+    # Embedding calls are I/O-bound, so score rows concurrently
+    with ThreadPoolExecutor(max_workers=SCORING_WORKERS) as pool:
+        all_scores = list(pool.map(score_answers_with_azure, [a for _, a in pending]))
 
+    for (i, _), scores in zip(pending, all_scores):
         for qid in QUESTION_COLUMNS:
-            ws.update_cell(i, col_index[f"Score {qid}"], scores[qid])
-        ws.update_cell(i, col_index["Total"], scores["total"])
+            queue_cell(i, f"Score {qid}", scores[qid])
+        queue_cell(i, "Total", scores["total"])
 
         updated += 1
 
+    # All score cells in one Sheets API request
+    if cell_updates:
+        ws.batch_update(cell_updates, value_input_option="USER_ENTERED")
+
     return f"Updated {updated} responses"
 
 if __name__ == "__main__":